@@ -1,4 +1,4 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright (C) 2023, Tomi Valkeinen <tomi.valkeinen@ideasonboard.com>
 
-from .conv import to_bgr888, buffer_to_bgr888
+from .conv import to_bgr888, buffer_to_bgr888, precompile
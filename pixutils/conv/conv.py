@@ -8,26 +8,46 @@ import numpy.typing as npt
 
 from pixutils.formats import PixelFormat, PixelColorEncoding
 
+from . import raw, yuv
 from .yuv import yuv_to_bgr888
 from .rgb import rgb_to_bgr888
 from .raw import raw_to_bgr888
 
 
-def to_bgr888(fmt: PixelFormat, w, h, bytesperline, arr: npt.NDArray[np.uint8],
-              options: None | dict = None):
-    if fmt.color == PixelColorEncoding.YUV:
-        return yuv_to_bgr888(arr, w, h, fmt, options)
+# The converters for each color encoding, called as
+# conv(fmt, w, h, bytesperline, arr, options)
+_CONVERTERS = {
+    PixelColorEncoding.YUV: lambda fmt, w, h, bytesperline, arr, options:
+        yuv_to_bgr888(arr, w, h, fmt, options),
+    PixelColorEncoding.RAW: lambda fmt, w, h, bytesperline, arr, options:
+        raw_to_bgr888(arr, w, h, bytesperline, fmt, options),
+    PixelColorEncoding.RGB: lambda fmt, w, h, bytesperline, arr, options:
+        rgb_to_bgr888(fmt, w, h, arr),
+}
 
-    if fmt.color == PixelColorEncoding.RAW:
-        return raw_to_bgr888(arr, w, h, bytesperline, fmt)
 
-    if fmt.color == PixelColorEncoding.RGB:
-        return rgb_to_bgr888(fmt, w, h, arr)
+def to_bgr888(fmt: PixelFormat, w, h, bytesperline, arr: npt.NDArray[np.uint8],
+              options: None | dict = None):
+    conv = _CONVERTERS.get(fmt.color)
+    if conv is None:
+        raise RuntimeError(f'Unsupported format {fmt}')
 
-    raise RuntimeError(f'Unsupported format {fmt}')
+    return conv(fmt, w, h, bytesperline, arr, options)
 
 
 def buffer_to_bgr888(fmt: PixelFormat, w, h, bytesperline, buffer, options: None | dict = None):
     arr = np.frombuffer(buffer, dtype=np.uint8)
     rgb = to_bgr888(fmt, w, h, bytesperline, arr, options)
     return rgb
+
+
+def precompile(fmt: PixelFormat, options: None | dict = None):
+    """Compile the Numba kernels used by to_bgr888() for the given format
+
+    See raw.precompile() and yuv.precompile(). The RGB conversions have no
+    kernels to compile.
+    """
+    if fmt.color == PixelColorEncoding.RAW:
+        raw.precompile(fmt)
+    elif fmt.color == PixelColorEncoding.YUV:
+        yuv.precompile(fmt, options)
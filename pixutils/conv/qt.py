@@ -6,19 +6,25 @@
 
 from __future__ import annotations
 
+import numpy as np
 from PyQt6 import QtGui
 from pixutils.formats import PixelFormat, PixelFormats
 from .conv import buffer_to_bgr888
 
 
 def bgr888_to_pix(rgb):
-    # QImage doesn't seem to like a numpy view
-    if rgb.base is not None:
-        rgb = rgb.copy()
+    # QImage reads the pixels straight from the buffer, without a copy, so it
+    # has to be contiguous. Views that already are, can be used as is. The
+    # QImage only lives until QPixmap.fromImage() has copied the pixels.
+    if not rgb.flags['C_CONTIGUOUS']:
+        rgb = np.ascontiguousarray(rgb)
 
     w = rgb.shape[1]
     h = rgb.shape[0]
-    qim = QtGui.QImage(rgb, w, h, QtGui.QImage.Format.Format_RGB888) # pylint: disable=no-member
+
+    # Pass the stride explicitly, as QImage would otherwise expect the lines
+    # to be 32-bit aligned
+    qim = QtGui.QImage(rgb, w, h, w * 3, QtGui.QImage.Format.Format_RGB888) # pylint: disable=no-member
     pix = QtGui.QPixmap.fromImage(qim)
     return pix
 
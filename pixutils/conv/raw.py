@@ -4,16 +4,35 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+import functools
+import threading
 
 import numpy as np
 import numpy.typing as npt
 
 from pixutils.formats import PixelFormat
 
-__all__ = ['raw_to_bgr888']
+try:
+    from .raw_nb import demosaic_bilinear_nb, unpack_10bit_nb, unpack_12bit_nb
+    USE_NUMBA = True
+except ImportError:
+    USE_NUMBA = False
 
+try:
+    from .raw_cp import demosaic_bilinear_cp
+    USE_CUPY = True
+except ImportError:
+    USE_CUPY = False
 
-@dataclass
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+__all__ = ['raw_to_bgr888', 'precompile']
+
+
+@dataclass(frozen=True)
 class BayerPattern:
     """Represents a Bayer pattern configuration"""
 
@@ -22,25 +41,22 @@ class BayerPattern:
     g1: tuple[int, int]
     b0: tuple[int, int]
 
-    @classmethod
-    def from_pattern(cls, pattern: str):
-        """Parse a Bayer pattern string (e.g., 'SRGGB') into coordinates"""
-        idx = pattern.find('R')
-        r0 = (idx % 2, idx // 2)
+    @staticmethod
+    def from_pattern(pattern: str) -> BayerPattern:
+        """Look up the coordinates for a Bayer pattern string (e.g., 'RGGB')"""
+        return _BAYER_PATTERNS[pattern]
 
-        idx = pattern.find('G')
-        g0 = (idx % 2, idx // 2)
 
-        idx = pattern.find('G', idx + 1)
-        g1 = (idx % 2, idx // 2)
+# The (x, y) coordinates of the R, G, G and B samples in the 2x2 block
+_BAYER_PATTERNS = {
+    'RGGB': BayerPattern((0, 0), (1, 0), (0, 1), (1, 1)),
+    'BGGR': BayerPattern((1, 1), (1, 0), (0, 1), (0, 0)),
+    'GRBG': BayerPattern((1, 0), (0, 0), (1, 1), (0, 1)),
+    'GBRG': BayerPattern((0, 1), (0, 0), (1, 1), (1, 0)),
+}
 
-        idx = pattern.find('B')
-        b0 = (idx % 2, idx // 2)
 
-        return cls(r0, g0, g1, b0)
-
-
-@dataclass
+@dataclass(frozen=True)
 class RawFormat:
     """Represents a raw image format configuration"""
 
@@ -49,6 +65,7 @@ class RawFormat:
     is_packed: bool
 
     @classmethod
+    @functools.lru_cache(maxsize=64)
     def from_pixelformat(cls, fmt: PixelFormat):
         """Parse a PixelFormat into raw format configuration"""
         name = fmt.name
@@ -65,8 +82,42 @@ class RawFormat:
                    is_packed=is_packed)
 
 
-def prepare_packed_raw(data: npt.NDArray[np.uint8], width: int, height: int,
-                      bits_per_pixel: int, bytesperline: int) -> npt.NDArray[np.uint16]:
+# Per-thread cache of the internal buffers used in the conversion, keyed by
+# the buffer's purpose, shape and dtype
+_scratch = threading.local()
+_SCRATCH_MAX_ENTRIES = 8
+
+
+def _get_scratch(name: str, shape: tuple[int, ...], dtype) -> npt.NDArray:
+    """Return a buffer that is reused across frames
+
+    The buffer is zeroed when allocated, but not when reused. It must not be
+    returned to the caller, as the next frame would overwrite it.
+    """
+    cache = getattr(_scratch, 'buffers', None)
+    if cache is None:
+        cache = _scratch.buffers = {}
+
+    key = (name, shape, np.dtype(dtype))
+
+    buf = cache.get(key)
+    if buf is None:
+        if len(cache) >= _SCRATCH_MAX_ENTRIES:
+            del cache[next(iter(cache))]
+
+        buf = np.zeros(shape, dtype=dtype)
+        cache[key] = buf
+
+    return buf
+
+
+# Shifts of the low bits of each pixel in the last byte of a packed group
+_UNPACK10_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+_UNPACK12_SHIFTS = np.array([4, 0], dtype=np.uint8)
+
+
+def _packed_rows(data: npt.NDArray[np.uint8], width: int, height: int,
+                 bits_per_pixel: int, bytesperline: int) -> npt.NDArray[np.uint8]:
     assert bits_per_pixel in [10, 12], 'Only 10 and 12 bpp are supported'
 
     # Reshape into rows if bytesperline is provided
@@ -75,121 +126,390 @@ def prepare_packed_raw(data: npt.NDArray[np.uint8], width: int, height: int,
     else:
         data = data.reshape((height, len(data) // height))
 
-    # Remove padding if present
+    # Remove padding if present. Slicing only creates a view, the unpacking
+    # reads the rows through it.
     padded_width = width * bits_per_pixel // 8
     if bytesperline > padded_width:
-        data = np.delete(data, np.s_[padded_width:], 1)
+        data = data[:, :padded_width]
 
-    # Unpack to 16-bit
-    if bits_per_pixel == 10:
-        arr16 = data.astype(np.uint16) << np.uint16(2)
-        for byte in range(4):
-            arr16[:, byte::5] |= (arr16[:, 4::5] >> ((4 - byte) * 2)) & 0b11
-        arr16 = np.delete(arr16, np.s_[4::5], 1)
+    return data
 
+
+def prepare_packed_raw(data: npt.NDArray[np.uint8], width: int, height: int,
+                      bits_per_pixel: int, bytesperline: int,
+                      out: None | npt.NDArray[np.uint16] = None) -> npt.NDArray[np.uint16]:
+    data = _packed_rows(data, width, height, bits_per_pixel, bytesperline)
+
+    shape = (data.shape[0], width)
+
+    if out is None:
+        out = np.empty(shape, dtype=np.uint16)
+    elif out.shape != shape or out.dtype != np.uint16 or not out.flags['C_CONTIGUOUS']:
+        raise ValueError(f'Output array must be a contiguous {shape} uint16 array')
+
+    if USE_NUMBA:
+        if bits_per_pixel == 10:
+            unpack_10bit_nb(data, out)
+        else:
+            unpack_12bit_nb(data, out)
+        return out
+
+    # Unpack to 16-bit. Each group of 5 (or 3) bytes holds the high bits of
+    # 4 (or 2) pixels, followed by a byte with the low bits of all of them.
+    # The high bits are shifted straight into the output array, and the low
+    # bits are merged for all the pixels of a group with a single broadcast
+    # operation.
+    if bits_per_pixel == 10:
+        group_bytes, lsb_shifts, lsb_mask = 5, _UNPACK10_SHIFTS, 0b11
     else:  # 12-bit
-        arr16 = data.astype(np.uint16) << np.uint16(4)
-        for byte in range(2):
-            arr16[:, byte::3] |= (arr16[:, 2::3] >> ((2 - byte) * 4)) & 0b1111
-        arr16 = np.delete(arr16, np.s_[2::3], 1)
+        group_bytes, lsb_shifts, lsb_mask = 3, _UNPACK12_SHIFTS, 0b1111
+
+    group_pixels = group_bytes - 1
+
+    groups = data.reshape((data.shape[0], -1, group_bytes))
+
+    arr16 = out.reshape((groups.shape[0], groups.shape[1], group_pixels))
+    np.left_shift(groups[..., :group_pixels], bits_per_pixel - 8, out=arr16, dtype=np.uint16)
+    arr16 |= (groups[..., group_pixels:] >> lsb_shifts) & lsb_mask
+
+    return out
+
 
-    return arr16
+def prepare_packed_raw_msb(data: npt.NDArray[np.uint8], width: int, height: int,
+                          bits_per_pixel: int, bytesperline: int) -> npt.NDArray[np.uint8]:
+    """Extract the high 8 bits of each pixel of packed RAW data"""
+    data = _packed_rows(data, width, height, bits_per_pixel, bytesperline)
+
+    # The high bits are stored as whole bytes at the start of each group, so
+    # this is a single strided copy, dropping the bytes with the low bits
+    group_bytes = 5 if bits_per_pixel == 10 else 3
+
+    groups = data.reshape((data.shape[0], -1, group_bytes))
+
+    return groups[..., :group_bytes - 1].reshape((data.shape[0], -1))
 
 
 def prepare_unpacked_raw(data: npt.NDArray[np.uint8], width: int, height: int,
-                        bits_per_pixel: int) -> npt.NDArray[np.uint16]:
+                        bits_per_pixel: int) -> npt.NDArray[np.uint8] | npt.NDArray[np.uint16]:
+    # 8-bit data is kept as is, the demosaic accumulates in wider types
     if bits_per_pixel == 8:
-        return data.reshape((height, width)).astype(np.uint16)
+        return data.reshape((height, width))
 
     if bits_per_pixel in [10, 12, 16]:
+        # Viewing the bytes as uint16 requires contiguous, 2-byte aligned
+        # data. Buffers at an odd offset, e.g. in an mmapped frame, are copied.
+        if data.ctypes.data % 2 or not data.flags['C_CONTIGUOUS']:
+            data = data.copy()
+
         return data.view(np.uint16).reshape((height, width))
 
     raise RuntimeError(f'Unsupported bits per pixel: {bits_per_pixel}')
 
 
-def demosaic(data: npt.NDArray[np.uint16], pattern: BayerPattern) -> npt.NDArray[np.uint16]:
+def _window_counts(n: int):
+    # Number of even and odd indices in the 3-wide window around each index
+    even = np.pad(np.arange(n) % 2 == 0, 1).astype(np.uint8)
+    even = even[:-2] + even[1:-1] + even[2:]
+
+    size = np.full(n, 3, dtype=np.uint8)
+    size[[0, -1]] -= 1
+
+    return even, size - even
+
+
+def _divisor_block(terms, rows: slice, cols: slice, out_shift: int) -> npt.NDArray[np.uint32]:
+    d = sum(np.outer(r[rows], c[cols]) for r, c in terms)
+    return d.astype(np.uint32) << out_shift
+
+
+@dataclass(frozen=True)
+class _PlaneDivisors:
+    """The sample counts of the 3x3 windows of one plane, shifted by out_shift"""
+
+    # Per position in the 2x2 block, valid everywhere except the borders
+    interior: tuple[tuple[int, int], tuple[int, int]]
+    top: npt.NDArray[np.uint32]
+    bottom: npt.NDArray[np.uint32]
+    left: npt.NDArray[np.uint32]
+    right: npt.NDArray[np.uint32]
+    # (row counts, column counts) pairs, whose outer products sum to the counts
+    terms: tuple
+    out_shift: int
+
+    def block(self, rows: slice) -> npt.NDArray[np.uint32]:
+        return _divisor_block(self.terms, rows, np.s_[:], self.out_shift)
+
+
+@functools.lru_cache(maxsize=8)
+def _demosaic_divisors(h: int, w: int, out_shift: int) -> tuple[_PlaneDivisors, ...]:
+    """Return the divisors of the 3x3 window sums of each plane
+
+    The number of samples in a window only depends on the position of the
+    pixel, so this is calculated once per frame size. Only the border lines
+    are stored, as in the interior the counts depend only on the parity.
+    """
+    rows_even, rows_odd = _window_counts(h)
+    cols_even, cols_odd = _window_counts(w)
+
+    # The sites are laid out as in demosaic(): G B / R G
+    plane_terms = (
+        ((rows_odd, cols_even),),                           # Red
+        ((rows_even, cols_even), (rows_odd, cols_odd)),     # Green
+        ((rows_even, cols_odd),),                           # Blue
+    )
+
+    planes = []
+
+    for terms in plane_terms:
+        def line(rows, cols, terms=terms):
+            # Shared by all the frames of this size
+            d = _divisor_block(terms, rows, cols, out_shift).ravel()
+            d.flags.writeable = False
+            return d
+
+        # Rows and columns 1 and 2 are not border lines with 4 or more lines,
+        # smaller frames are divided with block()
+        if h >= 4 and w >= 4:
+            interior = tuple(tuple(int(line(np.s_[2 - y:3 - y], np.s_[2 - x:3 - x])[0])
+                                   for x in range(2))
+                             for y in range(2))
+        else:
+            interior = ((0, 0), (0, 0))
+
+        planes.append(_PlaneDivisors(interior,
+                                     line(np.s_[:1], np.s_[:]),
+                                     line(np.s_[-1:], np.s_[:]),
+                                     line(np.s_[:], np.s_[:1]),
+                                     line(np.s_[:], np.s_[-1:]),
+                                     terms, out_shift))
+
+    return tuple(planes)
+
+
+def _divide_window_sums(psum, divisors: _PlaneDivisors, y0: int, frame_h: int, output):
+    """Divide the window sums of the band of rows starting at y0"""
+    h, w = psum.shape
+    y1 = y0 + h
+
+    # The output shift is folded into the divisors, as
+    # (psum // d) >> s == psum // (d << s)
+
+    if h < 4 or w < 4:
+        output[...] = psum // divisors.block(np.s_[y0:y1])
+        return
+
+    # In the interior the divisor only depends on the position in the 2x2
+    # block (the bands start at even rows). Divide the interior with
+    # scalars, which numpy does with a multiplication and a shift instead of
+    # a per-element integer division, and fix the border pixels afterwards.
+
+    for y in range(2):
+        for x in range(2):
+            output[y::2, x::2] = psum[y::2, x::2] // divisors.interior[y][x]
+
+    output[:, 0] = psum[:, 0] // divisors.left[y0:y1]
+    output[:, -1] = psum[:, -1] // divisors.right[y0:y1]
+
+    if y0 == 0:
+        output[0, :] = psum[0, :] // divisors.top
+    if y1 == frame_h:
+        output[-1, :] = psum[-1, :] // divisors.bottom
+
+
+# Rows of the image processed at a time by the numpy demosaic
+_DEMOSAIC_BAND_ROWS = 64
+
+
+def demosaic(data: npt.NDArray[np.uint8] | npt.NDArray[np.uint16],
+             pattern: BayerPattern, out_shift: int) -> npt.NDArray[np.uint8]:
+    """Demosaic the data, shifting the result right by out_shift to 8 bits"""
+    if USE_NUMBA:
+        return demosaic_bilinear_nb(data, pattern.r0, pattern.g0, pattern.g1, pattern.b0,
+                                    out_shift)
+
     # Debayering code from PiCamera documentation
 
-    # Separate the components from the Bayer data to RGB planes
     h, w = data.shape
 
-    # Separate the components from the Bayer data to RGB planes
-    rgb = np.zeros((h, w, 3), dtype=data.dtype)
-    rgb[1::2, 0::2, 0] = data[pattern.r0[1] :: 2, pattern.r0[0] :: 2]  # Red
-    rgb[0::2, 0::2, 1] = data[pattern.g0[1] :: 2, pattern.g0[0] :: 2]  # Green
-    rgb[1::2, 1::2, 1] = data[pattern.g1[1] :: 2, pattern.g1[0] :: 2]  # Green
-    rgb[0::2, 1::2, 2] = data[pattern.b0[1] :: 2, pattern.b0[0] :: 2]  # Blue
-
     # Below we present a fairly naive de-mosaic method that simply
-    # calculates the weighted average of a pixel based on the pixels
-    # surrounding it. The weighting is provided by a byte representation of
-    # the Bayer filter which we construct first:
+    # calculates the average of the same-color pixels surrounding each pixel.
+    # The number of those pixels in the 3x3 window depends only on the
+    # position of the pixel, and is cached per frame size by _demosaic_divisors().
+
+    # We use a 3x3 window to calculate each average, and the rgb planes have
+    # blank pixels at their edges to compensate for the size of the window
+    # when calculating averages for edge pixels. The planes are zeroed, as
+    # each pixel position holds a sample in only one of them. They are
+    # reused across frames: every frame writes the same sample positions,
+    # so the rest stays zero.
+    #
+    # The planes are stored separately (3 x h x w, instead of h x w x 3), so
+    # that each of them can be read contiguously.
+
+    rgb_padded = _get_scratch('demosaic', (3, h + 2, w + 2), data.dtype)
+    rgb = rgb_padded[:, 1:-1, 1:-1]
 
-    bayer = np.zeros(rgb.shape, dtype=np.uint8)
-    bayer[1::2, 0::2, 0] = 1  # Red
-    bayer[0::2, 0::2, 1] = 1  # Green
-    bayer[1::2, 1::2, 1] = 1  # Green
-    bayer[0::2, 1::2, 2] = 1  # Blue
+    # Separate the components from the Bayer data to RGB planes
+    rgb[0, 1::2, 0::2] = data[pattern.r0[1] :: 2, pattern.r0[0] :: 2]  # Red
+    rgb[1, 0::2, 0::2] = data[pattern.g0[1] :: 2, pattern.g0[0] :: 2]  # Green
+    rgb[1, 1::2, 1::2] = data[pattern.g1[1] :: 2, pattern.g1[0] :: 2]  # Green
+    rgb[2, 0::2, 1::2] = data[pattern.b0[1] :: 2, pattern.b0[0] :: 2]  # Blue
 
     # Allocate an array to hold our output with the same shape as the input
-    # data. After this we define the size of window that will be used to
-    # calculate each weighted average (3x3). Then we pad out the rgb and
-    # bayer arrays, adding blank pixels at their edges to compensate for the
-    # size of the window when calculating averages for edge pixels.
-
-    output = np.empty(rgb.shape, dtype=rgb.dtype)
-    window = (3, 3)
-    borders = (window[0] - 1, window[1] - 1)
-    border = (borders[0] // 2, borders[1] // 2)
-
-    rgb = np.pad(rgb, [
-        (border[0], border[0]),
-        (border[1], border[1]),
-        (0, 0),
-    ], 'constant')
-    bayer = np.pad(bayer, [
-        (border[0], border[0]),
-        (border[1], border[1]),
-        (0, 0),
-    ], 'constant')
+    # data
+
+    output = np.empty((h, w, 3), dtype=np.uint8)
+
+    divisors = _demosaic_divisors(h, w, out_shift)
 
     # For each plane in the RGB data, we calculate the 3x3 window sum
-    # and divide it with the weighted average. This version uses direct
+    # and divide it with the number of pixels. This version uses direct
     # computation of the sum, instead of using numpy's as_strided()
     # and einsum(), as the direct version is 2x as fast.
 
-    for plane in range(3):
-        p = rgb[..., plane]
-        b = bayer[..., plane]
+    # The window sums are accumulated in 32 bits, as a sum of 16-bit
+    # samples would overflow. The sum is separable: the horizontal 3-pixel
+    # sums are calculated first, and then summed vertically, which takes 4
+    # additions per pixel instead of 8.
+
+    # The image is processed in bands of rows, so that the 32-bit
+    # temporaries of a band stay in the CPU cache.
+
+    for y0 in range(0, h, _DEMOSAIC_BAND_ROWS):
+        y1 = min(y0 + _DEMOSAIC_BAND_ROWS, h)
 
-        # Direct computation of 3x3 window sum
-        psum = (p[:-2, :-2] + p[:-2, 1:-1] + p[:-2, 2:] +
-                p[1:-1, :-2] + p[1:-1, 1:-1] + p[1:-1, 2:] +
-                p[2:, :-2] + p[2:, 1:-1] + p[2:, 2:])
+        for plane in range(3):
+            p = rgb_padded[plane, y0:y1 + 2].astype(np.uint32)
 
-        bsum = (b[:-2, :-2] + b[:-2, 1:-1] + b[:-2, 2:] +
-                b[1:-1, :-2] + b[1:-1, 1:-1] + b[1:-1, 2:] +
-                b[2:, :-2] + b[2:, 1:-1] + b[2:, 2:])
+            # Direct computation of 3x3 window sum
+            hsum = p[:, :-2] + p[:, 1:-1]
+            hsum += p[:, 2:]
 
-        output[..., plane] = psum // bsum
+            psum = hsum[:-2] + hsum[1:-1]
+            psum += hsum[2:]
+
+            _divide_window_sums(psum, divisors[plane], y0, h, output[y0:y1, :, plane])
 
     return output
 
 
+def demosaic_opencv(data: npt.NDArray[np.uint8] | npt.NDArray[np.uint16],
+                    pattern: BayerPattern, out_shift: int) -> npt.NDArray[np.uint8]:
+    """Demosaic the data with OpenCV, shifting the result right by out_shift to 8 bits"""
+    if cv2 is None:
+        raise RuntimeError('OpenCV is not available')
+
+    # OpenCV names the Bayer patterns by the 2x2 block starting from the
+    # second row and column, so e.g. RGGB is 'BayerBG'. Indexed with the
+    # location of the red sample.
+    code = {
+        (0, 0): cv2.COLOR_BayerBG2RGB,  # RGGB
+        (1, 1): cv2.COLOR_BayerRG2RGB,  # BGGR
+        (1, 0): cv2.COLOR_BayerGB2RGB,  # GRBG
+        (0, 1): cv2.COLOR_BayerGR2RGB,  # GBRG
+    }[pattern.r0]
+
+    # Reduce to 8 bits first, so that OpenCV operates on 8-bit data
+    return cv2.cvtColor(_shift_to_8bit(data, out_shift), code)
+
+
+def demosaic_cupy(data: npt.NDArray[np.uint8] | npt.NDArray[np.uint16],
+                  pattern: BayerPattern, out_shift: int) -> npt.NDArray[np.uint8]:
+    """Demosaic the data on a CUDA GPU, shifting the result right by out_shift to 8 bits"""
+    if not USE_CUPY:
+        raise RuntimeError('CuPy is not available')
+
+    # The result is identical to demosaic()
+    return demosaic_bilinear_cp(data, pattern.r0, pattern.g0, pattern.g1, pattern.b0,
+                                out_shift)
+
+
+def _shift_to_8bit(data: npt.NDArray[np.uint8] | npt.NDArray[np.uint16],
+                   shift: int) -> npt.NDArray[np.uint8]:
+    if data.dtype == np.uint8:
+        return data
+
+    # The shift writes straight into the 8-bit array, without a 16-bit
+    # temporary
+    arr8 = np.empty(data.shape, dtype=np.uint8)
+    np.right_shift(data, shift, out=arr8, casting='unsafe')
+
+    return arr8
+
+
 def raw_to_bgr888(data: npt.NDArray[np.uint8], width: int, height: int,
-                  bytesperline: int, fmt: PixelFormat) -> npt.NDArray[np.uint8]:
+                  bytesperline: int, fmt: PixelFormat,
+                  options: None | dict = None) -> npt.NDArray[np.uint8]:
+    backend = options.get('backend') if options else None
+    precision = options.get('precision') if options else None
+
     # Parse the format
     raw_fmt = RawFormat.from_pixelformat(fmt)
 
-    # Prepare the raw data into a common 16-bit format
-    if raw_fmt.is_packed:
-        arr16 = prepare_packed_raw(data, width, height, raw_fmt.bits_per_pixel,
-                                   bytesperline)
+    out_shift = raw_fmt.bits_per_pixel - 8
+
+    # Prepare the raw data into one pixel per element: 8-bit data as uint8,
+    # deeper formats as uint16.
+    #
+    # With 8-bit precision, the low bits are dropped before the demosaic,
+    # which is faster but rounds slightly differently. For packed formats
+    # the low bits are then not unpacked at all.
+    if precision == '8bit':
+        if raw_fmt.is_packed:
+            arr = prepare_packed_raw_msb(data, width, height, raw_fmt.bits_per_pixel,
+                                         bytesperline)
+        else:
+            arr = prepare_unpacked_raw(data, width, height, raw_fmt.bits_per_pixel)
+            arr = _shift_to_8bit(arr, out_shift)
+        out_shift = 0
+    elif raw_fmt.is_packed:
+        # The unpacked data is only used within this function, so the same
+        # buffer can be used for every frame
+        rows = len(data) // bytesperline if bytesperline else height
+        arr = prepare_packed_raw(data, width, height, raw_fmt.bits_per_pixel,
+                                 bytesperline,
+                                 _get_scratch('unpack', (rows, width), np.uint16))
+    else:
+        arr = prepare_unpacked_raw(data, width, height, raw_fmt.bits_per_pixel)
+
+    # Perform demosaic, converting to 8-bit BGR
+    if backend == 'opencv':
+        rgb = demosaic_opencv(arr, raw_fmt.bayer_pattern, out_shift)
+    elif backend == 'cupy':
+        rgb = demosaic_cupy(arr, raw_fmt.bayer_pattern, out_shift)
     else:
-        arr16 = prepare_unpacked_raw(data, width, height, raw_fmt.bits_per_pixel)
+        rgb = demosaic(arr, raw_fmt.bayer_pattern, out_shift)
+
+    # The demosaic output is freshly allocated, so this is a no-op, but
+    # guarantees callers like the Qt helpers a contiguous array
+    return np.ascontiguousarray(rgb)
+
+
+def precompile(fmt: PixelFormat):
+    """Compile the Numba kernels used to convert the given RAW format
+
+    The kernels are compiled on their first use, which can take seconds, and
+    are then cached on disk. Calling this, e.g. from a background thread at
+    startup, moves the compilation away from the first converted frame.
+    """
+    if not USE_NUMBA:
+        return
+
+    width = 8
+    height = 4
+
+    # Numba compiles separately for each argument type, so the data is built
+    # like real frames: buffer_to_bgr888() uses np.frombuffer(), which gives
+    # read-only arrays.
+    data = np.frombuffer(bytes(fmt.framesize(width, height)), dtype=np.uint8)
+
+    raw_to_bgr888(data, width, height, 0, fmt)
+
+    # With padded lines, the packed rows are passed to the unpack kernels as
+    # a non-contiguous view
+    if RawFormat.from_pixelformat(fmt).is_packed:
+        bytesperline = fmt.stride(width) + 8
 
-    # Perform demosaic
-    rgb = demosaic(arr16, raw_fmt.bayer_pattern)
+        data = np.frombuffer(bytes(bytesperline * height), dtype=np.uint8)
 
-    # Convert to 8-bit BGR
-    return (rgb >> (raw_fmt.bits_per_pixel - 8)).astype(np.uint8)
+        raw_to_bgr888(data, width, height, bytesperline, fmt)
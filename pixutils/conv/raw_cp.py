@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (C) 2023, Tomi Valkeinen <tomi.valkeinen@ideasonboard.com>
+
+# CuPy (CUDA) version of the RAW demosaic in raw.py
+
+from __future__ import annotations
+
+import cupy as cp  # pylint: disable=import-error
+import numpy as np
+import numpy.typing as npt
+
+__all__ = ['demosaic_bilinear_cp']
+
+
+# One thread per output pixel. As in the other implementations, the output
+# uses a fixed layout for the color sites (G B / R G), and each component is
+# the average of the samples of that color in the 3x3 window around the
+# pixel. 'offsets' holds the (x, y) location in the source 2x2 Bayer block
+# for each site, indexed with (y & 1) * 2 + (x & 1).
+
+_DEMOSAIC_SRC = r'''
+extern "C" __global__
+void demosaic_bilinear(const unsigned short *data, unsigned char *out,
+                       int h, int w, int shift, const int *offsets)
+{
+    int x = blockDim.x * blockIdx.x + threadIdx.x;
+    int y = blockDim.y * blockIdx.y + threadIdx.y;
+
+    if (x >= w || y >= h)
+        return;
+
+    unsigned int sum[3] = { 0, 0, 0 };
+    unsigned int count[3] = { 0, 0, 0 };
+
+    for (int yy = max(y - 1, 0); yy <= min(y + 1, h - 1); yy++) {
+        for (int xx = max(x - 1, 0); xx <= min(x + 1, w - 1); xx++) {
+            int p = (yy & 1) * 2 + (xx & 1);
+            int c = p == 2 ? 0 : p == 1 ? 2 : 1;
+
+            int sy = (yy & ~1) + offsets[p * 2 + 1];
+            int sx = (xx & ~1) + offsets[p * 2 + 0];
+
+            sum[c] += data[sy * w + sx];
+            count[c]++;
+        }
+    }
+
+    for (int c = 0; c < 3; c++)
+        out[(y * w + x) * 3 + c] = (sum[c] / count[c]) >> shift;
+}
+'''
+
+_BLOCK = (32, 8)
+
+_demosaic_kernel = cp.RawKernel(_DEMOSAIC_SRC, 'demosaic_bilinear')
+
+
+def demosaic_bilinear_cp(data: npt.NDArray[np.uint8] | npt.NDArray[np.uint16],
+                         r0: tuple[int, int], g0: tuple[int, int],
+                         g1: tuple[int, int], b0: tuple[int, int],
+                         out_shift: int) -> npt.NDArray[np.uint8]:
+    h, w = data.shape
+
+    # Indexed with the site
+    offsets = cp.asarray([g0, b0, r0, g1], dtype=cp.int32)
+
+    data_gpu = cp.ascontiguousarray(cp.asarray(data, dtype=cp.uint16))
+    out_gpu = cp.empty((h, w, 3), dtype=cp.uint8)
+
+    grid = ((w + _BLOCK[0] - 1) // _BLOCK[0], (h + _BLOCK[1] - 1) // _BLOCK[1])
+
+    _demosaic_kernel(grid, _BLOCK, (data_gpu, out_gpu, np.int32(h), np.int32(w),
+                                    np.int32(out_shift), offsets))
+
+    return cp.asnumpy(out_gpu)
@@ -0,0 +1,188 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (C) 2023, Tomi Valkeinen <tomi.valkeinen@ideasonboard.com>
+
+# Numba accelerated versions of the RAW conversion helpers in raw.py
+
+# pylint: disable=not-an-iterable
+
+from __future__ import annotations
+
+import numpy as np
+import numpy.typing as npt
+from numba import njit, prange
+
+__all__ = ['demosaic_bilinear_nb', 'unpack_10bit_nb', 'unpack_12bit_nb']
+
+
+# The packed formats store groups of 5 (or 3) bytes: the high 8 bits of 4 (or
+# 2) pixels, followed by a byte with the low bits of all of them. The kernels
+# below unpack a group at a time, in a single pass over the data.
+
+@njit(parallel=True, cache=True)
+def _unpack10(data, out):
+    h, groups = out.shape[0], out.shape[1] // 4
+
+    for y in prange(h):
+        for g in range(groups):
+            lsb = np.uint16(data[y, g * 5 + 4])
+            for i in range(4):
+                out[y, g * 4 + i] = ((np.uint16(data[y, g * 5 + i]) << 2) |
+                                     ((lsb >> (6 - 2 * i)) & 0b11))
+
+
+@njit(parallel=True, cache=True)
+def _unpack12(data, out):
+    h, groups = out.shape[0], out.shape[1] // 2
+
+    for y in prange(h):
+        for g in range(groups):
+            lsb = np.uint16(data[y, g * 3 + 2])
+            out[y, g * 2 + 0] = (np.uint16(data[y, g * 3 + 0]) << 4) | (lsb >> 4)
+            out[y, g * 2 + 1] = (np.uint16(data[y, g * 3 + 1]) << 4) | (lsb & 0b1111)
+
+
+def unpack_10bit_nb(data: npt.NDArray[np.uint8], out: npt.NDArray[np.uint16]):
+    assert out.shape == (data.shape[0], data.shape[1] // 5 * 4)
+    _unpack10(data, out)
+
+
+def unpack_12bit_nb(data: npt.NDArray[np.uint8], out: npt.NDArray[np.uint16]):
+    assert out.shape == (data.shape[0], data.shape[1] // 3 * 2)
+    _unpack12(data, out)
+
+
+# The demosaic output uses a fixed layout for the color sites, regardless of
+# the Bayer pattern of the source data (see demosaic() in raw.py):
+#
+#   G B
+#   R G
+#
+# For each site, indexed with (y & 1) * 2 + (x & 1), 'offsets' holds the (x,
+# y) location of the corresponding component in the source 2x2 Bayer block.
+#
+# There is a separate kernel for each Bayer pattern, with the offsets as
+# compile time constants, so that the source locations are folded into the
+# address calculations. Each kernel is compiled on its first use.
+
+_SITE_OFFSETS = (
+    ((1, 0), (1, 1), (0, 0), (0, 1)),   # RGGB
+    ((1, 0), (0, 0), (1, 1), (0, 1)),   # BGGR
+    ((0, 0), (0, 1), (1, 0), (1, 1)),   # GRBG
+    ((0, 0), (1, 0), (0, 1), (1, 1)),   # GBRG
+)
+
+
+@njit(inline='always')
+def _site(data, offsets, y, x):
+    p = (y & 1) * 2 + (x & 1)
+    by = y & ~1
+    bx = x & ~1
+
+    if p == 0:
+        return np.int32(data[by + offsets[0][1], bx + offsets[0][0]])
+    if p == 1:
+        return np.int32(data[by + offsets[1][1], bx + offsets[1][0]])
+    if p == 2:
+        return np.int32(data[by + offsets[2][1], bx + offsets[2][0]])
+    return np.int32(data[by + offsets[3][1], bx + offsets[3][0]])
+
+
+@njit
+def _demosaic_border_pixel(data, offsets, shift, out, y, x):
+    h, w = data.shape
+
+    r = g = b = 0
+    rn = gn = bn = 0
+
+    for yy in range(max(y - 1, 0), min(y + 2, h)):
+        for xx in range(max(x - 1, 0), min(x + 2, w)):
+            v = _site(data, offsets, yy, xx)
+            p = (yy & 1) * 2 + (xx & 1)
+            if p == 1:
+                b += v
+                bn += 1
+            elif p == 2:
+                r += v
+                rn += 1
+            else:
+                g += v
+                gn += 1
+
+    out[y, x, 0] = (r // rn) >> shift
+    out[y, x, 1] = (g // gn) >> shift
+    out[y, x, 2] = (b // bn) >> shift
+
+
+@njit(inline='always')
+def _demosaic_interior_pixel(data, offsets, shift, out, y, x):
+    c = _site(data, offsets, y, x)
+
+    # Sums of the horizontal, vertical and diagonal neighbors
+    hs = _site(data, offsets, y, x - 1) + _site(data, offsets, y, x + 1)
+    vs = _site(data, offsets, y - 1, x) + _site(data, offsets, y + 1, x)
+    ds = (_site(data, offsets, y - 1, x - 1) + _site(data, offsets, y - 1, x + 1) +
+          _site(data, offsets, y + 1, x - 1) + _site(data, offsets, y + 1, x + 1))
+
+    p = (y & 1) * 2 + (x & 1)
+
+    if p == 0:      # Green, on a blue row
+        out[y, x, 0] = (vs // 2) >> shift
+        out[y, x, 1] = ((c + ds) // 5) >> shift
+        out[y, x, 2] = (hs // 2) >> shift
+    elif p == 1:    # Blue
+        out[y, x, 0] = (ds // 4) >> shift
+        out[y, x, 1] = ((hs + vs) // 4) >> shift
+        out[y, x, 2] = c >> shift
+    elif p == 2:    # Red
+        out[y, x, 0] = c >> shift
+        out[y, x, 1] = ((hs + vs) // 4) >> shift
+        out[y, x, 2] = (ds // 4) >> shift
+    else:           # Green, on a red row
+        out[y, x, 0] = (hs // 2) >> shift
+        out[y, x, 1] = ((c + ds) // 5) >> shift
+        out[y, x, 2] = (vs // 2) >> shift
+
+
+@njit(inline='always')
+def _demosaic_row(data, offsets, shift, out, y):
+    h, w = data.shape
+
+    if y in (0, h - 1):
+        for x in range(w):
+            _demosaic_border_pixel(data, offsets, shift, out, y, x)
+        return
+
+    _demosaic_border_pixel(data, offsets, shift, out, y, 0)
+
+    for x in range(1, w - 1):
+        _demosaic_interior_pixel(data, offsets, shift, out, y, x)
+
+    _demosaic_border_pixel(data, offsets, shift, out, y, w - 1)
+
+
+def _make_demosaic_kernel(offsets):
+    @njit(parallel=True, cache=True, fastmath=True)
+    def kernel(data, shift, out):
+        for y in prange(data.shape[0]):
+            _demosaic_row(data, offsets, shift, out, y)
+
+    return kernel
+
+
+_DEMOSAIC_KERNELS = {offsets: _make_demosaic_kernel(offsets) for offsets in _SITE_OFFSETS}
+
+
+def demosaic_bilinear_nb(data: npt.NDArray[np.uint8] | npt.NDArray[np.uint16],
+                         r0: tuple[int, int], g0: tuple[int, int],
+                         g1: tuple[int, int], b0: tuple[int, int],
+                         out_shift: int) -> npt.NDArray[np.uint8]:
+    h, w = data.shape
+
+    # Indexed with the site, see _site()
+    kernel = _DEMOSAIC_KERNELS[(g0, b0, r0, g1)]
+
+    output = np.empty((h, w, 3), dtype=np.uint8)
+
+    kernel(data, out_shift, output)
+
+    return output
@@ -6,44 +6,51 @@ import numpy.typing as npt
 
 from pixutils.formats import PixelFormat, PixelFormats
 
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def _gather_components(src: npt.NDArray[np.uint8], components: slice, cv2_code: str):
+    """Copy the given components of src into a new contiguous array"""
+    # OpenCV has SIMD shuffles for these, which are much faster than numpy's
+    # strided copy. The result is identical.
+    if cv2 is not None:
+        return cv2.cvtColor(src, getattr(cv2, cv2_code))
+
+    return np.ascontiguousarray(src[..., components])
+
 
 def rgb_to_bgr888(fmt: PixelFormat, w, h, data: npt.NDArray[np.uint8]):
     if fmt == PixelFormats.RGB888:
         rgb = data.reshape((h, w, 3))
-        rgb = np.flip(rgb, axis=2) # Flip the components
+        rgb = _gather_components(rgb, np.s_[::-1],     # Flip the components
+                                 'COLOR_RGB2BGR')
     elif fmt == PixelFormats.BGR888:
         rgb = data.reshape((h, w, 3))
     elif fmt in [PixelFormats.ARGB8888, PixelFormats.XRGB8888]:
         rgb = data.reshape((h, w, 4))
-        rgb = np.delete(rgb, np.s_[3::4], axis=2) # drop alpha component
-        rgb = np.flip(rgb, axis=2) # Flip the components
+        rgb = _gather_components(rgb, np.s_[2::-1],    # Drop alpha, flip the components
+                                 'COLOR_BGRA2RGB')
     elif fmt in [PixelFormats.ABGR8888, PixelFormats.XBGR8888]:
         rgb = data.reshape((h, w, 4))
-        rgb = np.delete(rgb, np.s_[3::4], axis=2) # drop alpha component
+        rgb = _gather_components(rgb, np.s_[:3],       # Drop alpha
+                                 'COLOR_RGBA2RGB')
     elif fmt == PixelFormats.XBGR2101010:
-        rgb = data.reshape((h, w * 4)) #.astype(np.uint16)
-
-        print(rgb.shape, rgb.dtype)
+        rgb = data.reshape((h, w * 4))
 
         v = rgb.view(np.dtype('<u4'))
 
-        print('{:#x}'.format(v[0, 0]))
-
-        output = np.zeros((h, w, 3), dtype=np.uint16)
-
-        output[:, :, 0] = v & 0x3ff             # R
-        output[:, :, 1] = (v >> 10) & 0x3ff     # G
-        output[:, :, 2] = (v >> 20) & 0x3ff     # B
-
-        rgb = output
-
-        print('{}'.format(rgb[0, 0]))
+        # Each component is shifted so that its top 8 bits are the low byte,
+        # and the unsafe cast to uint8 drops the rest. This writes straight
+        # into the output, without 16-bit temporaries.
 
-        rgb >>= 10 - 8
-        rgb = rgb.astype(np.uint8)
+        rgb = np.empty((h, w, 3), dtype=np.uint8)
 
-        #rgb = np.delete(rgb, np.s_[3::4], axis=2) # drop alpha component
-        #rgb = np.flip(rgb, axis=2) # Flip the components
+        np.right_shift(v, 2, out=rgb[:, :, 0], casting='unsafe')    # R
+        np.right_shift(v, 12, out=rgb[:, :, 1], casting='unsafe')   # G
+        np.right_shift(v, 22, out=rgb[:, :, 2], casting='unsafe')   # B
     else:
         raise RuntimeError(f'Unsupported RGB format {fmt}')
 
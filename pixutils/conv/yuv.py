@@ -1,11 +1,27 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright (C) 2023, Tomi Valkeinen <tomi.valkeinen@ideasonboard.com>
 
+from __future__ import annotations
+
+import functools
+
 import numpy as np
 import numpy.typing as npt
 
 from pixutils.formats import PixelFormats
 
+try:
+    from .yuv_nb import nv12_to_bgr888_nb, yuv422_to_bgr888_nb
+    USE_NUMBA = True
+except ImportError:
+    USE_NUMBA = False
+
+try:
+    from .yuv_cp import nv12_batch_to_bgr888_cp
+    USE_CUPY = True
+except ImportError:
+    USE_CUPY = False
+
 YCBCR_VALUES = {
     'bt601': {
         'limited': {
@@ -28,7 +44,30 @@ YCBCR_VALUES = {
 }
 
 
-def ycbcr_to_bgr888(yuv: npt.NDArray[np.uint8], options) -> npt.NDArray[np.uint8]:
+# The conversions are done in fixed point, with the matrix scaled by
+# 2^YCBCR_FRAC_BITS. The Numba kernels use the same arithmetic, so both give
+# identical results.
+YCBCR_FRAC_BITS = 16
+
+
+@functools.lru_cache
+def _get_conversion(color_encoding: str, color_range: str):
+    """Return the fixed point matrix, the offsets and the bias for the conversion"""
+    conv_data = YCBCR_VALUES[color_encoding][color_range]
+
+    offset = np.array(conv_data['offsets'], dtype=np.int32)
+
+    m = np.array(conv_data['matrix']) * (1 << YCBCR_FRAC_BITS)
+    m = np.round(m).astype(np.int32)
+
+    # The conversion is linear, so the offsets can be applied after the
+    # multiplication: (yuv + offset) @ m == yuv @ m + offset @ m
+    bias = offset @ m
+
+    return m, offset, bias
+
+
+def _get_options_conversion(options):
     color_range = 'limited'
     color_encoding = 'bt601'
 
@@ -36,67 +75,129 @@ def ycbcr_to_bgr888(yuv: npt.NDArray[np.uint8], options) -> npt.NDArray[np.uint8
         color_range = options.get('range', color_range)
         color_encoding = options.get('encoding', color_encoding)
 
-    conv_data = YCBCR_VALUES[color_encoding][color_range]
+    return _get_conversion(color_encoding, color_range)
+
+
+def _get_output(out: None | npt.NDArray[np.uint8], h: int, w: int) -> npt.NDArray[np.uint8]:
+    """Return 'out', or a new BGR888 array if it is None"""
+    shape = (h, w, 3)
+
+    if out is None:
+        return np.empty(shape, dtype=np.uint8)
+
+    if out.shape != shape or out.dtype != np.uint8 or not out.flags['C_CONTIGUOUS']:
+        raise ValueError(f'Output array must be a contiguous {shape} uint8 array')
+
+    return out
+
 
-    offset = np.array(conv_data['offsets'])
+def ycbcr_planes_to_bgr888(y: npt.NDArray[np.uint8], u: npt.NDArray[np.uint8],
+                           v: npt.NDArray[np.uint8], options,
+                           out: None | npt.NDArray[np.uint8] = None) -> npt.NDArray[np.uint8]:
+    """Convert Y, U and V planes to BGR888, with U and V possibly subsampled
 
-    m = np.array(conv_data['matrix'])
+    The result is written to 'out' if given, so that a buffer can be reused
+    between frames.
+    """
+    m, _, bias = _get_options_conversion(options)
 
-    rgb = np.dot(yuv + offset, m)
+    h, w = y.shape
+    ch, cw = u.shape
 
-    rgb = np.clip(rgb, 0, 255)
-    rgb = rgb.astype(np.uint8)
+    # The subsampled chroma terms are upsampled by broadcasting them over
+    # blocks of luma pixels, without copying. The luma term and the output
+    # are viewed as (chroma rows, sub rows, chroma cols, sub cols).
+    blocks = (ch, h // ch, cw, w // cw)
+
+    # The multiplications widen the 8-bit samples to 32 bits on the fly, and
+    # the offsets are added as a single bias to the smaller chroma term.
+
+    rgb = _get_output(out, h, w)
+
+    for c in range(3):
+        chroma = np.multiply(u, m[1, c], dtype=np.int32)
+        chroma += np.multiply(v, m[2, c], dtype=np.int32)
+        chroma += bias[c]
+
+        acc = np.multiply(y, m[0, c], dtype=np.int32).reshape(blocks)
+        acc += chroma[:, None, :, None]
+        acc >>= YCBCR_FRAC_BITS
+        np.clip(acc, 0, 255, out=acc)
+        rgb[..., c].reshape(blocks)[...] = acc
 
     return rgb
 
 
-def yuyv_to_bgr888(data, w, h, options):
+def ycbcr_to_bgr888(yuv: npt.NDArray[np.uint8], options,
+                    out: None | npt.NDArray[np.uint8] = None) -> npt.NDArray[np.uint8]:
+    return ycbcr_planes_to_bgr888(yuv[..., 0], yuv[..., 1], yuv[..., 2], options, out)
+
+
+def yuyv_to_bgr888(data, w, h, options, out=None):
     # YUV422
     yuyv = data.reshape((h, w // 2 * 4))
 
-    # YUV444
-    yuv = np.empty((h, w, 3), dtype=np.uint8)
-    yuv[:, :, 0] = yuyv[:, 0::2]                    # Y
-    yuv[:, :, 1] = yuyv[:, 1::4].repeat(2, axis=1)  # U
-    yuv[:, :, 2] = yuyv[:, 3::4].repeat(2, axis=1)  # V
+    if USE_NUMBA:
+        m, _, bias = _get_options_conversion(options)
+        # Byte offsets of Y0, U, Y1 and V in each 4 byte group
+        return yuv422_to_bgr888_nb(yuyv, (0, 1, 2, 3), m, bias, YCBCR_FRAC_BITS,
+                                   _get_output(out, h, w))
 
-    return ycbcr_to_bgr888(yuv, options)
+    return ycbcr_planes_to_bgr888(yuyv[:, 0::2],    # Y
+                                  yuyv[:, 1::4],    # U
+                                  yuyv[:, 3::4],    # V
+                                  options, out)
 
 
-def uyvy_to_bgr888(data, w, h, options):
+def uyvy_to_bgr888(data, w, h, options, out=None):
     # YUV422
     yuyv = data.reshape((h, w // 2 * 4))
 
-    # YUV444
-    yuv = np.empty((h, w, 3), dtype=np.uint8)
-    yuv[:, :, 0] = yuyv[:, 1::2]                    # Y
-    yuv[:, :, 1] = yuyv[:, 0::4].repeat(2, axis=1)  # U
-    yuv[:, :, 2] = yuyv[:, 2::4].repeat(2, axis=1)  # V
+    if USE_NUMBA:
+        m, _, bias = _get_options_conversion(options)
+        # Byte offsets of Y0, U, Y1 and V in each 4 byte group
+        return yuv422_to_bgr888_nb(yuyv, (1, 0, 3, 2), m, bias, YCBCR_FRAC_BITS,
+                                   _get_output(out, h, w))
 
-    return ycbcr_to_bgr888(yuv, options)
+    return ycbcr_planes_to_bgr888(yuyv[:, 1::2],    # Y
+                                  yuyv[:, 0::4],    # U
+                                  yuyv[:, 2::4],    # V
+                                  options, out)
 
 
-def nv12_to_bgr888(data, w, h, options):
+def nv12_to_bgr888(data, w, h, options, out=None):
     plane1 = data[:w * h]
     plane2 = data[w * h:]
 
     y = plane1.reshape((h, w))
     uv = plane2.reshape((h // 2, w // 2, 2))
 
-    # YUV444
-    yuv = np.empty((h, w, 3), dtype=np.uint8)
-    yuv[:, :, 0] = y[:, :]                    # Y
-    yuv[:, :, 1] = uv[:, :, 0].repeat(2, axis=0).repeat(2, axis=1)  # U
-    yuv[:, :, 2] = uv[:, :, 1].repeat(2, axis=0).repeat(2, axis=1)  # V
+    if USE_NUMBA:
+        m, _, bias = _get_options_conversion(options)
+        return nv12_to_bgr888_nb(y, uv, m, bias, YCBCR_FRAC_BITS, _get_output(out, h, w))
+
+    return ycbcr_planes_to_bgr888(y, uv[:, :, 0], uv[:, :, 1], options, out)
+
+
+def nv12_batch_to_bgr888_cupy(frames, w, h, options):
+    """Convert a (N, framesize) stack of NV12 frames on a CUDA GPU
+
+    The frames may already be on the GPU. The result is a (N, h, w, 3) CuPy
+    array, identical to converting each frame with nv12_to_bgr888().
+    """
+    if not USE_CUPY:
+        raise RuntimeError('CuPy is not available')
 
-    return ycbcr_to_bgr888(yuv, options)
+    m, _, bias = _get_options_conversion(options)
+    return nv12_batch_to_bgr888_cp(frames, w, h, m, bias, YCBCR_FRAC_BITS)
 
 
-def y8_to_bgr888(data, w, h):
+def y8_to_bgr888(data, w, h, out=None):
     y = data.reshape((h, w))
 
-    # YUV444
-    yuv = np.zeros((h, w, 3), dtype=np.uint8)
+    # YUV444. Three strided channel writes are faster with numpy than
+    # copying a broadcast view.
+    yuv = _get_output(out, h, w)
     yuv[:, :, 0] = y  # Y
     yuv[:, :, 1] = y  # U
     yuv[:, :, 2] = y  # V
@@ -104,17 +205,52 @@ def y8_to_bgr888(data, w, h):
     return yuv
 
 
-def yuv_to_bgr888(arr, w, h, fmt, options):
-    if fmt == PixelFormats.Y8:
-        return y8_to_bgr888(arr, w, h)
+# The converters for each YUV format, called as conv(arr, w, h, options, out)
+_CONVERTERS = {
+    PixelFormats.Y8: lambda arr, w, h, options, out: y8_to_bgr888(arr, w, h, out),
+    PixelFormats.YUYV: yuyv_to_bgr888,
+    PixelFormats.UYVY: uyvy_to_bgr888,
+    PixelFormats.NV12: nv12_to_bgr888,
+}
+
+
+def yuv_to_bgr888(arr, w, h, fmt, options, out=None):
+    conv = _CONVERTERS.get(fmt)
+    if conv is None:
+        raise RuntimeError(f'Unsupported YUV format {fmt}')
+
+    return conv(arr, w, h, options, out)
+
+
+def yuv_to_output(arr, w, h, fmt, sink_formats, options):
+    """Prepare a YUV frame for a consumer that accepts the given formats
+
+    Returns a (format, data) tuple. If the consumer accepts 'fmt' as is
+    (e.g. a JPEG encoder taking YUYV), the data is returned untouched and no
+    conversion is done. Otherwise the frame is converted with
+    yuv_to_bgr888() to a (h, w, 3) array, and the format is BGR888.
+    """
+    if fmt in sink_formats:
+        return fmt, arr
+
+    return PixelFormats.BGR888, yuv_to_bgr888(arr, w, h, fmt, options)
+
+
+def precompile(fmt, options=None):
+    """Compile the Numba kernels used to convert the given YUV format
 
-    if fmt == PixelFormats.YUYV:
-        return yuyv_to_bgr888(arr, w, h, options)
+    The kernels are compiled for each conversion (the options) on their
+    first use, which can take seconds, and are then cached on disk. Calling
+    this, e.g. from a background thread at startup, moves the compilation
+    away from the first converted frame.
+    """
+    if not USE_NUMBA:
+        return
 
-    if fmt == PixelFormats.UYVY:
-        return uyvy_to_bgr888(arr, w, h, options)
+    width = 8
+    height = 4
 
-    if fmt == PixelFormats.NV12:
-        return nv12_to_bgr888(arr, w, h, options)
+    # Like real frames from buffer_to_bgr888(), which uses np.frombuffer()
+    data = np.frombuffer(bytes(fmt.framesize(width, height)), dtype=np.uint8)
 
-    raise RuntimeError(f'Unsupported YUV format {fmt}')
+    yuv_to_bgr888(data, width, height, fmt, options)
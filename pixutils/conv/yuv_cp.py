@@ -0,0 +1,70 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (C) 2023, Tomi Valkeinen <tomi.valkeinen@ideasonboard.com>
+
+# CuPy (CUDA) version of the NV12 conversion in yuv.py, for batches of frames
+
+from __future__ import annotations
+
+import cupy as cp  # pylint: disable=import-error
+import numpy as np
+import numpy.typing as npt
+
+__all__ = ['nv12_batch_to_bgr888_cp']
+
+
+# One thread per output pixel, with the frame index in the z dimension of
+# the grid, so that the whole batch is converted with a single launch. The
+# arithmetic is the same fixed point conversion as in yuv.py: 'm' is the
+# conversion matrix scaled by 2^frac_bits, and 'bias' holds the offsets
+# multiplied by the matrix.
+
+_NV12_SRC = r'''
+extern "C" __global__
+void nv12_to_bgr888(const unsigned char *data, unsigned char *out,
+                    int h, int w, const int *m, const int *bias, int frac_bits)
+{
+    int x = blockDim.x * blockIdx.x + threadIdx.x;
+    int y = blockDim.y * blockIdx.y + threadIdx.y;
+    int n = blockIdx.z;
+
+    if (x >= w || y >= h)
+        return;
+
+    const unsigned char *frame = data + (size_t)n * (w * h + w * h / 2);
+    const unsigned char *uv = frame + w * h + (y / 2) * w + (x & ~1);
+
+    int yv = frame[y * w + x];
+    int u = uv[0];
+    int v = uv[1];
+
+    unsigned char *dst = out + (((size_t)n * h + y) * w + x) * 3;
+
+    for (int c = 0; c < 3; c++) {
+        int val = (yv * m[c] + u * m[3 + c] + v * m[6 + c] + bias[c]) >> frac_bits;
+        dst[c] = min(max(val, 0), 255);
+    }
+}
+'''
+
+_BLOCK = (32, 8, 1)
+
+_nv12_kernel = cp.RawKernel(_NV12_SRC, 'nv12_to_bgr888')
+
+
+def nv12_batch_to_bgr888_cp(frames, w: int, h: int,
+                            m: npt.NDArray[np.int32], bias: npt.NDArray[np.int32],
+                            frac_bits: int):
+    """Convert a (N, framesize) stack of NV12 frames to a (N, h, w, 3) CuPy array"""
+    n = frames.shape[0]
+
+    # The frames are copied to the GPU only if they are not there already
+    frames_gpu = cp.ascontiguousarray(cp.asarray(frames, dtype=cp.uint8))
+    out_gpu = cp.empty((n, h, w, 3), dtype=cp.uint8)
+
+    grid = ((w + _BLOCK[0] - 1) // _BLOCK[0], (h + _BLOCK[1] - 1) // _BLOCK[1], n)
+
+    _nv12_kernel(grid, _BLOCK, (frames_gpu, out_gpu, np.int32(h), np.int32(w),
+                                cp.asarray(m, dtype=cp.int32), cp.asarray(bias, dtype=cp.int32),
+                                np.int32(frac_bits)))
+
+    return out_gpu
@@ -0,0 +1,123 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (C) 2023, Tomi Valkeinen <tomi.valkeinen@ideasonboard.com>
+
+# Numba accelerated versions of the YUV conversions in yuv.py
+
+# pylint: disable=not-an-iterable
+
+from __future__ import annotations
+
+import functools
+
+import numpy as np
+import numpy.typing as npt
+from numba import njit, prange
+
+__all__ = ['nv12_to_bgr888_nb', 'yuv422_to_bgr888_nb']
+
+
+# The conversion uses the same fixed point arithmetic as yuv.py: 'm' is the
+# conversion matrix scaled by 2^frac_bits, and 'bias' holds the offsets
+# multiplied by the matrix.
+#
+# There is a separate kernel for each conversion (matrix, offsets and the
+# byte layout), with those as compile time constants. The kernels only
+# capture plain int tuples, so that they are found in the Numba disk cache
+# by later processes. The first process to use a conversion compiles it,
+# which takes a second or two, see precompile() in yuv.py.
+
+# The chroma terms, with the bias, are shared by the pixels that use the same
+# U and V samples, so they are calculated only once
+@njit(inline='always')
+def _chroma_terms(m, bias, u, v):
+    return (u * m[1][0] + v * m[2][0] + bias[0],
+            u * m[1][1] + v * m[2][1] + bias[1],
+            u * m[1][2] + v * m[2][2] + bias[2])
+
+
+@njit(inline='always')
+def _store_pixel(m, frac_bits, out, row, col, y, c):
+    r = (y * m[0][0] + c[0]) >> frac_bits
+    g = (y * m[0][1] + c[1]) >> frac_bits
+    b = (y * m[0][2] + c[2]) >> frac_bits
+
+    out[row, col, 0] = min(max(r, 0), 255)
+    out[row, col, 1] = min(max(g, 0), 255)
+    out[row, col, 2] = min(max(b, 0), 255)
+
+
+@functools.lru_cache
+def _make_yuv422_kernel(offsets, m, bias, frac_bits):
+    oy0, ou, oy1, ov = offsets
+
+    @njit(parallel=True, cache=True)
+    def kernel(data, out):
+        h = out.shape[0]
+        groups = out.shape[1] // 2
+
+        for row in prange(h):
+            for g in range(groups):
+                src = g * 4
+
+                c = _chroma_terms(m, bias, np.int32(data[row, src + ou]),
+                                  np.int32(data[row, src + ov]))
+
+                _store_pixel(m, frac_bits, out, row, g * 2, np.int32(data[row, src + oy0]), c)
+                _store_pixel(m, frac_bits, out, row, g * 2 + 1, np.int32(data[row, src + oy1]), c)
+
+    return kernel
+
+
+@functools.lru_cache
+def _make_nv12_kernel(m, bias, frac_bits):
+    # Each iteration handles a 2x2 block of pixels sharing the same U and V
+    @njit(parallel=True, cache=True)
+    def kernel(y_plane, uv_plane, out):
+        ch, cw = uv_plane.shape[:2]
+
+        for crow in prange(ch):
+            row = crow * 2
+
+            for g in range(cw):
+                col = g * 2
+
+                c = _chroma_terms(m, bias, np.int32(uv_plane[crow, g, 0]),
+                                  np.int32(uv_plane[crow, g, 1]))
+
+                _store_pixel(m, frac_bits, out, row, col, np.int32(y_plane[row, col]), c)
+                _store_pixel(m, frac_bits, out, row, col + 1, np.int32(y_plane[row, col + 1]), c)
+                _store_pixel(m, frac_bits, out, row + 1, col, np.int32(y_plane[row + 1, col]), c)
+                _store_pixel(m, frac_bits, out, row + 1, col + 1,
+                             np.int32(y_plane[row + 1, col + 1]), c)
+
+    return kernel
+
+
+def _as_constants(m: npt.NDArray[np.int32], bias: npt.NDArray[np.int32]):
+    # Hashable versions of the conversion, to look up the kernels
+    return tuple(map(tuple, m.tolist())), tuple(bias.tolist())
+
+
+def yuv422_to_bgr888_nb(data: npt.NDArray[np.uint8], offsets: tuple[int, int, int, int],
+                        m: npt.NDArray[np.int32], bias: npt.NDArray[np.int32],
+                        frac_bits: int, out: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """Convert packed YUV 4:2:2 rows, with Y0, U, Y1, V at the given byte offsets"""
+    assert out.shape == (data.shape[0], data.shape[1] // 2, 3)
+
+    kernel = _make_yuv422_kernel(offsets, *_as_constants(m, bias), frac_bits)
+
+    kernel(data, out)
+
+    return out
+
+
+def nv12_to_bgr888_nb(y: npt.NDArray[np.uint8], uv: npt.NDArray[np.uint8],
+                      m: npt.NDArray[np.int32], bias: npt.NDArray[np.int32],
+                      frac_bits: int, out: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    assert out.shape == (*y.shape, 3)
+
+    kernel = _make_nv12_kernel(*_as_constants(m, bias), frac_bits)
+
+    kernel(y, uv, out)
+
+    return out
@@ -1,22 +1,17 @@
 from __future__ import annotations
 
+import struct
+
 __all__ = ['fourcc_to_str', 'str_to_fourcc']
 
+_FOURCC = struct.Struct('<I')
+
 
 def fourcc_to_str(fourcc: int):
-    return ''.join((
-        chr((fourcc >> 0) & 0xff),
-        chr((fourcc >> 8) & 0xff),
-        chr((fourcc >> 16) & 0xff),
-        chr((fourcc >> 24) & 0xff)
-    ))
+    return _FOURCC.pack(fourcc).decode('latin-1')
 
 def str_to_fourcc(s: str):
     if len(s) != 4:
         raise ValueError('Invalid fourcc string')
 
-    return \
-        ord(s[0]) << 0 | \
-        ord(s[1]) << 8 | \
-        ord(s[2]) << 16 | \
-        ord(s[3]) << 24
+    return _FOURCC.unpack(s.encode('latin-1'))[0]
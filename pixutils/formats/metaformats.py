@@ -33,24 +33,22 @@ class MetaFormat:
         return stride * height
 
 
-class MetaFormats:
-    __FMT_LIST: list[MetaFormat] = []
+def _lookup(fmt_map, key):
+    # Raise StopIteration for unknown formats, as the callers expect
+    fmt = fmt_map.get(key)
+    if fmt is None:
+        raise StopIteration
+    return fmt
 
-    @staticmethod
-    def __init_fmt_list():
-        # Perhaps there is some better way to handle this...
-        if not MetaFormats.__FMT_LIST:
-            MetaFormats.__FMT_LIST = [v for v in MetaFormats.__dict__.values() if isinstance(v, MetaFormat)]
 
+class MetaFormats:
     @staticmethod
     def find_v4l2_fourcc(fourcc):
-        MetaFormats.__init_fmt_list()
-        return next(f for f in MetaFormats.__FMT_LIST if f.v4l2_fourcc == fourcc)
+        return _lookup(_BY_V4L2_FOURCC, fourcc)
 
     @staticmethod
     def find_by_name(name):
-        MetaFormats.__init_fmt_list()
-        return next(f for f in MetaFormats.__FMT_LIST if f.name == name)
+        return _lookup(_BY_NAME, name)
 
     GENERIC_8 = MetaFormat('GENERIC_8', 'MET8', 2, 2)
     GENERIC_CSI2_10 = MetaFormat('GENERIC_CSI2_10', 'MC1A', 4, 5)
@@ -58,3 +56,17 @@ class MetaFormats:
 
     RPI_FE_CFG = MetaFormat('RPI_FE_CFG', 'RPFC', 1, 1)
     RPI_FE_STATS = MetaFormat('RPI_FE_STATS', 'RPFS', 1, 1)
+
+
+def _build_map(fmts, attr):
+    fmt_map = {}
+    # On duplicate keys, the first format is used, as with a linear search
+    for f in fmts:
+        fmt_map.setdefault(getattr(f, attr), f)
+    return fmt_map
+
+
+# The format set is static, so the lookup tables are built once at import
+_FMT_LIST = [v for v in MetaFormats.__dict__.values() if isinstance(v, MetaFormat)]
+_BY_V4L2_FOURCC: dict[int, MetaFormat] = _build_map(_FMT_LIST, 'v4l2_fourcc')
+_BY_NAME: dict[str, MetaFormat] = _build_map(_FMT_LIST, 'name')
@@ -1,34 +1,99 @@
 from __future__ import annotations
 
-from enum import Enum
-from math import ceil
-from typing import NamedTuple
+import functools
+import operator
+from enum import IntEnum
 
 from .fourcc_str import str_to_fourcc
 
 __all__ = ['PixelColorEncoding', 'PixelFormat', 'PixelFormats']
 
 
-class PixelColorEncoding(Enum):
+class PixelColorEncoding(IntEnum):
     RGB = 0
     YUV = 1
     RAW = 2
     UNDEFINED = 3
 
 
-class PixelFormatPlaneInfo(NamedTuple):
+# A slotted class, as the fields are read in the size calculations, and slot
+# access is faster than NamedTuple field access. This is not a dataclass, as
+# importing dataclasses would add milliseconds to the import time.
+class PixelFormatPlaneInfo:
+    __slots__ = ('bytes_per_block', 'pixels_per_block', 'hsub', 'vsub')
+
     bytes_per_block: int
     pixels_per_block: int
     hsub: int
     vsub: int
 
-def _div_round_up(a: int, b: int):
-    return int(ceil(a / b))
+    def __init__(self, bytes_per_block: int, pixels_per_block: int, hsub: int, vsub: int) -> None:
+        # The formats are shared, and their sizes cached, so keep these immutable
+        object.__setattr__(self, 'bytes_per_block', bytes_per_block)
+        object.__setattr__(self, 'pixels_per_block', pixels_per_block)
+        object.__setattr__(self, 'hsub', hsub)
+        object.__setattr__(self, 'vsub', vsub)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    # Compared and hashed by value, as the NamedTuple it replaced
+    def __eq__(self, other):
+        if not isinstance(other, PixelFormatPlaneInfo):
+            return NotImplemented
+        return _plane_info_fields(self) == _plane_info_fields(other)
+
+    def __hash__(self):
+        return hash(_plane_info_fields(self))
+
+    def __repr__(self):
+        return (f'PixelFormatPlaneInfo(bytes_per_block={self.bytes_per_block}, '
+                f'pixels_per_block={self.pixels_per_block}, hsub={self.hsub}, vsub={self.vsub})')
+
+_plane_info_fields = operator.attrgetter(*PixelFormatPlaneInfo.__slots__)
 
 def _align_up(a: int, b: int):
-    return _div_round_up(a, b) * b
+    # ceil(a / b) * b, in integer math to avoid float rounding
+    return (a + b - 1) // b * b
+
+# The sizes are calculated for the same few formats and resolutions over and
+# over again, so the results are cached. The PixelFormat methods pass the
+# arguments through operator.index(), so that e.g. numpy integers, which hash
+# like the equal ints, do not end up in the cache and get returned to other
+# callers.
+
+@functools.lru_cache(maxsize=256)
+def _stride(fmt: PixelFormat, width: int, plane: int, align: int):
+    if plane >= len(fmt.planes):
+        raise RuntimeError()
+
+    assert width % fmt.pixel_align[0] == 0
+
+    pi = fmt.planes[plane]
+
+    assert width % pi.pixels_per_block == 0
+    stride = width // pi.pixels_per_block * pi.bytes_per_block
+
+    assert stride % pi.hsub == 0
+    stride = stride // pi.hsub
+
+    stride = _align_up(stride, align)
+
+    return stride
+
+@functools.lru_cache(maxsize=256)
+def _framesize(fmt: PixelFormat, width: int, height: int, align: int):
+    size = 0
+
+    for i in range(len(fmt.planes)):
+        stride = fmt.stride(width, i, align)
+        size += fmt.planesize(stride, height, i)
+
+    return size
 
 class PixelFormat:
+    __slots__ = ('name', 'drm_fourcc', 'v4l2_fourcc', 'color', 'packed', 'pixel_align', 'planes')
+
     def __init__(self, name: str,
                  drm_fourcc: None | str, v4l2_fourcc: None | str,
                  colorencoding: PixelColorEncoding, packed: bool,
@@ -64,22 +129,7 @@ class PixelFormat:
                 _align_up(height, self.pixel_align[1]))
 
     def stride(self, width: int, plane: int = 0, align = 1):
-        if plane >= len(self.planes):
-            raise RuntimeError()
-
-        assert width % self.pixel_align[0] == 0
-
-        pi = self.planes[plane]
-
-        assert width % pi.pixels_per_block == 0
-        stride = width // pi.pixels_per_block * pi.bytes_per_block
-
-        assert stride % pi.hsub == 0
-        stride = stride // pi.hsub
-
-        stride = _align_up(stride, align)
-
-        return stride
+        return _stride(self, operator.index(width), operator.index(plane), operator.index(align))
 
     def planesize(self, stride: int, height: int, plane: int = 0):
         assert height % self.pixel_align[1] == 0
@@ -92,11 +142,22 @@ class PixelFormat:
 
 
     def framesize(self, width: int, height: int, align = 1):
+        return _framesize(self, operator.index(width), operator.index(height), operator.index(align))
+
+    def framesize_batch(self, widths, heights, align = 1):
+        """
+        Returns the frame sizes for arrays of widths and heights, e.g. for
+        all the modes of a sensor at once.
+
+        Only arithmetic operators are used, so numpy arrays work without
+        pixutils.formats depending on numpy. Unlike framesize(), the
+        sizes are not validated against the format's alignment.
+        """
         size = 0
 
-        for i in range(len(self.planes)):
-            stride = self.stride(width, i, align)
-            size += self.planesize(stride, height, i)
+        for pi in self.planes:
+            stride = widths // pi.pixels_per_block * pi.bytes_per_block // pi.hsub
+            size = size + _align_up(stride, align) * (heights // pi.vsub)
 
         return size
 
@@ -132,34 +193,30 @@ class PixelFormat:
         return width, height, bitspp
 
 
-class PixelFormats:
-    __FMT_LIST: list[PixelFormat] = []
+def _lookup(fmt_map, key):
+    # Raise StopIteration for unknown formats, as the callers expect
+    fmt = fmt_map.get(key)
+    if fmt is None:
+        raise StopIteration
+    return fmt
 
-    @staticmethod
-    def __init_fmt_list():
-        # Perhaps there is some better way to handle this...
-        if not PixelFormats.__FMT_LIST:
-            PixelFormats.__FMT_LIST = [v for v in PixelFormats.__dict__.values() if isinstance(v, PixelFormat)]
 
+class PixelFormats:
     @staticmethod
     def find_v4l2_fourcc(fourcc: int):
-        PixelFormats.__init_fmt_list()
-        return next(f for f in PixelFormats.__FMT_LIST if f.v4l2_fourcc == fourcc)
+        return _lookup(_BY_V4L2_FOURCC, fourcc)
 
     @staticmethod
     def find_drm_fourcc(fourcc: int):
-        PixelFormats.__init_fmt_list()
-        return next(f for f in PixelFormats.__FMT_LIST if f.drm_fourcc == fourcc)
+        return _lookup(_BY_DRM_FOURCC, fourcc)
 
     @staticmethod
     def find_by_name(name):
-        PixelFormats.__init_fmt_list()
-        return next(f for f in PixelFormats.__FMT_LIST if f.name == name)
+        return _lookup(_BY_NAME, name)
 
     @staticmethod
     def get_formats():
-        PixelFormats.__init_fmt_list()
-        return PixelFormats.__FMT_LIST
+        return _FMT_LIST
 
     # RGB 16-bit, no alpha
 
@@ -452,3 +509,19 @@ class PixelFormats:
         ( 1, 1 ),
         ( ( 1, ), ),
     )
+
+
+def _build_map(fmts, attr):
+    fmt_map = {}
+    # On duplicate keys, the first format is used, as with a linear search
+    for f in fmts:
+        fmt_map.setdefault(getattr(f, attr), f)
+    return fmt_map
+
+
+# The format set is static, so the lookup tables are built once at import
+_FMT_LIST: tuple[PixelFormat, ...] = tuple(v for v in PixelFormats.__dict__.values()
+                                           if isinstance(v, PixelFormat))
+_BY_V4L2_FOURCC: dict[None | int, PixelFormat] = _build_map(_FMT_LIST, 'v4l2_fourcc')
+_BY_DRM_FOURCC: dict[None | int, PixelFormat] = _build_map(_FMT_LIST, 'drm_fourcc')
+_BY_NAME: dict[str, PixelFormat] = _build_map(_FMT_LIST, 'name')
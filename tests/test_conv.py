@@ -5,10 +5,14 @@ import gzip
 import os
 import unittest
 import re
+import subprocess
+import sys
+from unittest import mock
 import numpy as np
 
 from pixutils.formats import PixelFormats, PixelFormat
 from pixutils.conv import buffer_to_bgr888
+from pixutils.conv import raw, rgb, yuv
 
 TEST_PATH = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = f'{TEST_PATH}/conv-test-data'
@@ -16,6 +20,15 @@ DATA_PATH = f'{TEST_PATH}/conv-test-data'
 
 class TestConv(unittest.TestCase):
     def test_conversions(self):
+        self.run_test_images()
+
+    @mock.patch.object(raw, 'USE_NUMBA', False)
+    @mock.patch.object(yuv, 'USE_NUMBA', False)
+    @mock.patch.object(rgb, 'cv2', None)
+    def test_conversions_numpy(self):
+        self.run_test_images()
+
+    def run_test_images(self):
         for fname in glob.glob(f'{DATA_PATH}/*.bin.gz'):
             bname = os.path.basename(fname)
             m = re.match(r'(\d+)x(\d+)-(\w+).bin.gz',  bname)
@@ -26,7 +39,8 @@ class TestConv(unittest.TestCase):
             height = int(m.group(2))
             fmt = PixelFormats.find_by_name(m.group(3))
 
-            self.run_test_image(width, height, fmt)
+            with self.subTest(fmt=fmt.name):
+                self.run_test_image(width, height, fmt)
 
     def run_test_image(self, width: int, height: int, fmt: PixelFormat):
         with gzip.open(f'{DATA_PATH}/{width}x{height}-{fmt.name}.bin.gz', 'rb') as f:
@@ -49,6 +63,172 @@ class TestConv(unittest.TestCase):
 
         self.assertFalse(diff.any())
 
+    @unittest.skipIf(raw.cv2 is None, 'OpenCV not available')
+    def test_opencv_backend(self):
+        width = 64
+        height = 48
+
+        # A flat SRGGB10 image
+        data = np.empty((height, width), dtype=np.uint16)
+        data[0::2, 0::2] = 400  # R
+        data[0::2, 1::2] = 200  # G
+        data[1::2, 0::2] = 200  # G
+        data[1::2, 1::2] = 100  # B
+
+        for backend in [None, 'opencv']:
+            rgb_buf = buffer_to_bgr888(PixelFormats.SRGGB10, width, height, 0, data,
+                                       {'backend': backend})
+            self.assertEqual(rgb_buf.shape, (height, width, 3))
+            self.assertTrue((rgb_buf == [100, 50, 25]).all())
+
+    @unittest.skipIf(not raw.USE_CUPY, 'CuPy not available')
+    def test_cupy_backend(self):
+        width = 64
+        height = 48
+
+        rng = np.random.default_rng(0)
+        data8 = rng.integers(0, 256, (height, width), dtype=np.uint8)
+        data10 = rng.integers(0, 1024, (height, width), dtype=np.uint16)
+
+        for fmt, data in [(PixelFormats.SRGGB8, data8), (PixelFormats.SBGGR8, data8),
+                          (PixelFormats.SGRBG8, data8), (PixelFormats.SGBRG8, data8),
+                          (PixelFormats.SRGGB10, data10)]:
+            with self.subTest(fmt=fmt.name):
+                ref_buf = buffer_to_bgr888(fmt, width, height, 0, data)
+                rgb_buf = buffer_to_bgr888(fmt, width, height, 0, data, {'backend': 'cupy'})
+                self.assertTrue((rgb_buf == ref_buf).all())
+
+    @unittest.skipIf(not yuv.USE_CUPY, 'CuPy not available')
+    def test_cupy_nv12_batch(self):
+        width = 64
+        height = 48
+
+        rng = np.random.default_rng(0)
+        frames = rng.integers(0, 256, (3, width * height * 3 // 2), dtype=np.uint8)
+
+        rgb_batch = yuv.nv12_batch_to_bgr888_cupy(frames, width, height, None).get()
+        self.assertEqual(rgb_batch.shape, (3, height, width, 3))
+
+        for frame, rgb_buf in zip(frames, rgb_batch):
+            ref_buf = buffer_to_bgr888(PixelFormats.NV12, width, height, 0, frame)
+            self.assertTrue((rgb_buf == ref_buf).all())
+
+    def test_yuv_out(self):
+        width = 64
+        height = 48
+
+        rng = np.random.default_rng(0)
+        out = np.empty((height, width, 3), dtype=np.uint8)
+
+        for fmt in [PixelFormats.Y8, PixelFormats.YUYV, PixelFormats.UYVY, PixelFormats.NV12]:
+            data = rng.integers(0, 256, fmt.framesize(width, height), dtype=np.uint8)
+
+            for use_numba in [False, yuv.USE_NUMBA]:
+                with self.subTest(fmt=fmt.name, numba=use_numba), \
+                     mock.patch.object(yuv, 'USE_NUMBA', use_numba):
+                    ref_buf = yuv.yuv_to_bgr888(data, width, height, fmt, None)
+                    rgb_buf = yuv.yuv_to_bgr888(data, width, height, fmt, None, out)
+                    self.assertIs(rgb_buf, out)
+                    self.assertTrue((rgb_buf == ref_buf).all())
+
+        with self.assertRaises(ValueError):
+            yuv.yuv_to_bgr888(data, width, height, PixelFormats.NV12, None,
+                              np.empty((height, width, 4), dtype=np.uint8))
+
+    def test_yuv_passthrough(self):
+        width = 64
+        height = 48
+
+        rng = np.random.default_rng(0)
+        data = rng.integers(0, 256, width * height * 2, dtype=np.uint8)
+
+        fmt, out = yuv.yuv_to_output(data, width, height, PixelFormats.YUYV,
+                                     {PixelFormats.YUYV, PixelFormats.NV12}, None)
+        self.assertEqual(fmt, PixelFormats.YUYV)
+        self.assertIs(out, data)
+
+        fmt, out = yuv.yuv_to_output(data, width, height, PixelFormats.YUYV,
+                                     {PixelFormats.NV12}, None)
+        self.assertEqual(fmt, PixelFormats.BGR888)
+        self.assertEqual(out.shape, (height, width, 3))
+        self.assertEqual(out.dtype, np.uint8)
+        self.assertEqual(out.tobytes(),
+                         yuv.yuv_to_bgr888(data, width, height, PixelFormats.YUYV, None).tobytes())
+
+    @unittest.skipIf(not raw.USE_NUMBA, 'Numba not available')
+    def test_precompile(self):
+        # Run in a new process, as the other tests compile kernels for all
+        # kinds of arguments. The kernels compiled by precompile() must be the
+        # ones used for real frames, both with and without padded lines.
+        script = '''if True:
+            from pixutils.formats import PixelFormats
+            from pixutils.conv import buffer_to_bgr888, precompile, raw_nb, yuv, yuv_nb
+
+            for fmt in [PixelFormats.YUYV, PixelFormats.UYVY, PixelFormats.NV12,
+                        PixelFormats.SRGGB8, PixelFormats.SRGGB10, PixelFormats.SRGGB10P]:
+                precompile(fmt)
+
+            m, _, bias = yuv._get_options_conversion(None)
+            consts = (*yuv_nb._as_constants(m, bias), yuv.YCBCR_FRAC_BITS)
+
+            kernels = [raw_nb._unpack10, raw_nb._unpack12, *raw_nb._DEMOSAIC_KERNELS.values(),
+                       yuv_nb._make_yuv422_kernel((0, 1, 2, 3), *consts),
+                       yuv_nb._make_yuv422_kernel((1, 0, 3, 2), *consts),
+                       yuv_nb._make_nv12_kernel(*consts)]
+
+            before = [len(k.signatures) for k in kernels]
+
+            width, height = 64, 48
+
+            for fmt in [PixelFormats.YUYV, PixelFormats.UYVY, PixelFormats.NV12,
+                        PixelFormats.SRGGB8, PixelFormats.SRGGB10, PixelFormats.SRGGB10P]:
+                buffer_to_bgr888(fmt, width, height, 0, bytes(fmt.framesize(width, height)))
+
+                if fmt.packed:
+                    bytesperline = fmt.stride(width) + 16
+                    buffer_to_bgr888(fmt, width, height, bytesperline, bytes(bytesperline * height))
+
+            assert before == [len(k.signatures) for k in kernels]
+
+            # The number of kernels compiled instead of loaded from the disk cache
+            print(sum(sum(k.stats.cache_misses.values()) for k in kernels))
+        '''
+
+        # The first process saves anything missing from the disk cache, so
+        # the second one must not compile anything
+        for _ in range(2):
+            res = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                 check=False)
+            self.assertEqual(res.returncode, 0, res.stderr)
+
+        self.assertEqual(res.stdout.strip(), '0')
+
+    def test_8bit_precision(self):
+        width = 64
+        height = 48
+
+        # A flat SRGGB10 image, with values in the low bits that are dropped
+        # with 8-bit precision
+        data = np.empty((height, width), dtype=np.uint16)
+        data[0::2, 0::2] = 403  # R
+        data[0::2, 1::2] = 202  # G
+        data[1::2, 0::2] = 201  # G
+        data[1::2, 1::2] = 103  # B
+
+        # The same image as SRGGB10P
+        packed = np.empty((height, width // 4, 5), dtype=np.uint8)
+        pixels = data.reshape((height, width // 4, 4))
+        packed[..., :4] = pixels >> 2
+        packed[..., 4] = ((pixels[..., 0] & 3) << 6 | (pixels[..., 1] & 3) << 4 |
+                          (pixels[..., 2] & 3) << 2 | (pixels[..., 3] & 3))
+
+        for fmt, buf in [(PixelFormats.SRGGB10, data), (PixelFormats.SRGGB10P, packed)]:
+            with self.subTest(fmt=fmt.name):
+                rgb_buf = buffer_to_bgr888(fmt, width, height, 0, buf.flatten(),
+                                           {'precision': '8bit'})
+                self.assertEqual(rgb_buf.shape, (height, width, 3))
+                self.assertTrue((rgb_buf == [100, 50, 25]).all())
+
 
 if __name__ == '__main__':
     unittest.main()
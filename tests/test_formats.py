@@ -7,7 +7,11 @@ from operator import mul
 from typing import NamedTuple
 import unittest
 
-from pixutils.formats.pixelformats import PixelFormat, PixelFormats
+import numpy as np
+
+from pixutils.formats.pixelformats import PixelFormat, PixelFormatPlaneInfo, PixelFormats
+from pixutils.formats.metaformats import MetaFormats
+from pixutils.formats.fourcc_str import str_to_fourcc
 
 class TestData(NamedTuple):
     format: PixelFormat
@@ -70,6 +74,62 @@ class TestFormats(unittest.TestCase):
                              dumb_size,
                              f'dumb size failed for {fmt}')
 
+    def test_cached_sizes_are_ints(self):
+        # numpy integers hash like the equal ints, and must not leak through
+        # the size caches to other callers
+        fmt = PixelFormats.YUYV
+        self.assertIs(type(fmt.stride(np.int32(320))), int)
+        self.assertIs(type(fmt.stride(320)), int)
+        self.assertIs(type(fmt.framesize(np.int32(320), np.int32(240))), int)
+        self.assertIs(type(fmt.framesize(320, 240)), int)
+
+    def test_framesize_batch(self):
+        widths = np.array([data.width for data in TEST_DATA] + [640, 2592])
+        heights = np.array([data.height for data in TEST_DATA] + [480, 1944])
+
+        for data in TEST_DATA:
+            fmt = data.format
+            sizes = fmt.framesize_batch(widths, heights, 64)
+            self.assertEqual(sizes.tolist(),
+                             [fmt.framesize(w, h, 64) for w, h in zip(widths, heights)],
+                             f'framesize_batch failed for {fmt}')
+
+
+class TestPixelFormats(unittest.TestCase):
+    def test_plane_info(self):
+        self.assertEqual(PixelFormatPlaneInfo(1, 1, 1, 1), PixelFormatPlaneInfo(1, 1, 1, 1))
+        self.assertNotEqual(PixelFormatPlaneInfo(1, 1, 1, 1), PixelFormatPlaneInfo(2, 1, 1, 1))
+        self.assertEqual(hash(PixelFormatPlaneInfo(2, 1, 2, 2)),
+                         hash(PixelFormatPlaneInfo(2, 1, 2, 2)))
+        self.assertEqual(PixelFormats.NV12.planes[1], PixelFormatPlaneInfo(2, 1, 2, 2))
+
+        with self.assertRaises(AttributeError):
+            PixelFormats.NV12.planes[0].hsub = 2
+
+    def test_find(self):
+        self.assertIs(PixelFormats.find_by_name('NV12'), PixelFormats.NV12)
+        self.assertIs(PixelFormats.find_v4l2_fourcc(str_to_fourcc('NM12')), PixelFormats.NV12)
+        self.assertIs(PixelFormats.find_drm_fourcc(str_to_fourcc('NV12')), PixelFormats.NV12)
+
+        with self.assertRaises(StopIteration):
+            PixelFormats.find_by_name('FOO')
+        with self.assertRaises(StopIteration):
+            PixelFormats.find_v4l2_fourcc(0)
+        with self.assertRaises(StopIteration):
+            PixelFormats.find_drm_fourcc(0)
+
+
+class TestMetaFormats(unittest.TestCase):
+    def test_find(self):
+        self.assertIs(MetaFormats.find_by_name('GENERIC_CSI2_10'), MetaFormats.GENERIC_CSI2_10)
+        self.assertIs(MetaFormats.find_v4l2_fourcc(str_to_fourcc('RPFS')),
+                      MetaFormats.RPI_FE_STATS)
+
+        with self.assertRaises(StopIteration):
+            MetaFormats.find_by_name('FOO')
+        with self.assertRaises(StopIteration):
+            MetaFormats.find_v4l2_fourcc(0)
+
 
 if __name__ == '__main__':
     unittest.main()